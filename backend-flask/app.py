@@ -1,11 +1,31 @@
 # app.py
-from flask import Flask, request, jsonify, send_file
+from flask import (Flask, request, jsonify, send_file, g, abort,
+                   make_response)
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 import sqlite3
 import os
 import jwt
+import json
+import time
+import random
+import hashlib
+import threading
+import io
+import sys
+import re
+import hmac
+import uuid
+import pstats
+import cProfile
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+import numpy as np
 from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateTable
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 from datetime import datetime
 
@@ -18,6 +38,20 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'very-secret-key'  # Vulnerability: Hardcoded secret
 # Vulnerability: Unsanitized file uploads
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# Per-term SQLite files holding archived courses and their dependent rows
+app.config['ARCHIVE_FOLDER'] = os.environ.get('ARCHIVE_FOLDER', 'archives')
+# Optional traffic capture: JSON Lines file and fraction of requests sampled
+app.config['TRAFFIC_CAPTURE_PATH'] = os.environ.get('TRAFFIC_CAPTURE_PATH')
+app.config['TRAFFIC_CAPTURE_SAMPLE_RATE'] = float(
+    os.environ.get('TRAFFIC_CAPTURE_SAMPLE_RATE', '1.0'))
+# Request profiling: fraction of requests sampled, and the token that both
+# forces profiling via the X-Profile-Token header and unlocks the admin API
+app.config['PROFILE_FOLDER'] = os.environ.get('PROFILE_FOLDER', 'profiles')
+app.config['PROFILE_SAMPLE_RATE'] = float(
+    os.environ.get('PROFILE_SAMPLE_RATE', '0.0'))
+app.config['PROFILE_TOKEN'] = os.environ.get('PROFILE_TOKEN')
+# Oldest profiles beyond this count are deleted as new ones are written
+app.config['PROFILE_MAX_COUNT'] = int(os.environ.get('PROFILE_MAX_COUNT', '200'))
 
 db = SQLAlchemy(app)
 
@@ -35,6 +69,12 @@ class Enrollment(db.Model):
 
     # Vulnerability: No unique constraint on student_id and course_id
 
+    # Lets a student's enrolled course IDs be read from the index alone
+    __table_args__ = (
+        db.Index('ix_enrollment_student_course', 'student_id', 'course_id'),
+        {'sqlite_autoincrement': True},
+    )
+
 
 class Grade(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -46,6 +86,12 @@ class Grade(db.Model):
     feedback = db.Column(db.Text)
     graded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Lets the analytics cache check the latest grade without a table scan
+    __table_args__ = (
+        db.Index('ix_grade_course_graded', 'course_id', 'graded_at'),
+        {'sqlite_autoincrement': True},
+    )
+
 # Update submission model to ensure course relationship
 
 
@@ -60,6 +106,9 @@ class Submission(db.Model):
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
     grades = db.relationship('Grade', backref='submission', lazy=True)
 
+    # Archived rows are deleted here, so their IDs must never be handed out again
+    __table_args__ = {'sqlite_autoincrement': True}
+
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -76,6 +125,9 @@ class Course(db.Model):
     teacher_id = db.Column(
         db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # Archived rows are deleted here, so their IDs must never be handed out again
+    __table_args__ = {'sqlite_autoincrement': True}
+
 
 class Assignment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -85,6 +137,24 @@ class Assignment(db.Model):
         'course.id'), nullable=False)
     due_date = db.Column(db.DateTime, nullable=False)
 
+    # Composite index so per-course deadline lookups are a range scan
+    __table_args__ = (
+        db.Index('ix_assignment_course_due', 'course_id', 'due_date'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+class ArchivedCourse(db.Model):
+    # Hot-database index of courses moved to a term archive
+    course_id = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(40), nullable=False)
+    title = db.Column(db.String(100), nullable=False)
+    teacher_id = db.Column(
+        db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # 'in_progress' until every dependent row has been moved
+    status = db.Column(db.String(20), nullable=False, default='in_progress')
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 
 def is_course_teacher(course_id: int, teacher_id: int) -> bool:
     """
@@ -99,7 +169,405 @@ def is_course_teacher(course_id: int, teacher_id: int) -> bool:
     """
     course = Course.query.filter_by(
         id=course_id, teacher_id=teacher_id).first()
-    return course is not None
+    if course is not None:
+        return True
+
+    archived = ArchivedCourse.query.filter_by(
+        course_id=course_id, teacher_id=teacher_id, status='archived').first()
+    return archived is not None
+
+
+def archive_path(term: str) -> str:
+    """Return the absolute path of the archive database for a term."""
+    return os.path.abspath(os.path.join(
+        app.config['ARCHIVE_FOLDER'], f'{secure_filename(term)}.db'))
+
+
+def get_archived_course(course_id: int):
+    """Return the ArchivedCourse entry if the course is archived or being archived."""
+    return db.session.get(ArchivedCourse, course_id)
+
+
+@contextmanager
+def course_data(course_id: int):
+    """
+    Locate the database holding a course's assignments, enrollments,
+    submissions and grades.
+
+    Hot courses are read from the main database. For archived courses the
+    term archive is attached to the session's connection for the duration
+    of the block and detached afterwards. Courses still being moved are
+    split across both databases, so reading them aborts with 503.
+
+    Args:
+        course_id (int): The ID of the course being read
+
+    Yields:
+        str: Schema name to read course data from, 'main' or 'archive'
+    """
+    archived = get_archived_course(course_id)
+    if archived is None:
+        yield 'main'
+        return
+    if archived.status != 'archived':
+        abort(make_response(jsonify(
+            {'message': 'Course is being archived, try again later'}), 503))
+
+    connection = db.session.connection()
+    connection.exec_driver_sql(
+        'ATTACH DATABASE ? AS archive', (archive_path(archived.term),))
+    try:
+        yield 'archive'
+    finally:
+        connection.exec_driver_sql('DETACH DATABASE archive')
+
+
+def course_query(model, schema: str):
+    """Build a query for model against the schema from course_data()."""
+    if schema == 'main':
+        return model.query
+    return model.query.execution_options(
+        schema_translate_map={None: schema})
+
+
+# Traffic capture for replay load testing
+
+SENSITIVE_FIELDS = {'password', 'token', 'secret'}
+# Enumerated values that identify nobody and are needed for a faithful replay
+PRESERVED_FIELDS = {'role', 'format'}
+_traffic_capture_lock = threading.Lock()
+
+
+def anonymize_body(value, key=None):
+    """
+    Strip personal data from a captured JSON body while keeping its shape.
+
+    Numbers, booleans and enumerated fields are kept so IDs and grades still
+    replay, sensitive fields are masked and other strings are replaced by a
+    stable hash.
+
+    Args:
+        value: Parsed JSON value to anonymize
+        key (str): Name of the field holding the value, if any
+
+    Returns:
+        The anonymized value
+    """
+    if isinstance(value, dict):
+        return {k: anonymize_body(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [anonymize_body(v, key) for v in value]
+    if isinstance(value, str):
+        if key in SENSITIVE_FIELDS:
+            return '***'
+        if key in PRESERVED_FIELDS:
+            return value
+        return 'anon-' + hashlib.sha256(value.encode()).hexdigest()[:12]
+    return value
+
+
+def get_token_user():
+    """
+    Decode the request's bearer token and load the user it belongs to.
+
+    The result is kept on g, so the sub-requests of a batch call share a
+    single decode and lookup.
+
+    Returns:
+        User: The token's user, or None if the user no longer exists
+
+    Raises:
+        jwt.InvalidTokenError: If the token is missing or invalid
+    """
+    token = request.headers.get('Authorization', '').split('Bearer ')[-1]
+    cached = g.get('token_user')
+    if cached and cached[0] == token:
+        return cached[1]
+
+    payload = jwt.decode(
+        token, app.config['SECRET_KEY'], algorithms=['HS256'])
+    user = db.session.get(User, payload['user_id'])
+    g.token_user = (token, user)
+    return user
+
+
+def get_token_role():
+    """Return the role claim of the request's bearer token, if it is valid."""
+    token = request.headers.get('Authorization', '').split('Bearer ')[-1]
+    try:
+        payload = jwt.decode(
+            token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        return payload.get('role')
+    except jwt.InvalidTokenError:
+        return None
+
+
+@app.before_request
+def start_traffic_capture():
+    if not app.config.get('TRAFFIC_CAPTURE_PATH'):
+        return
+    if random.random() >= app.config['TRAFFIC_CAPTURE_SAMPLE_RATE']:
+        return
+    g.traffic_capture_start = time.perf_counter()
+
+
+@app.after_request
+def record_traffic_capture(response):
+    start = g.pop('traffic_capture_start', None)
+    if start is None:
+        return response
+
+    body = request.get_json(silent=True) if request.is_json else None
+    record = {
+        'ts': time.time(),
+        'method': request.method,
+        'path': request.path,
+        'route': request.url_rule.rule if request.url_rule else None,
+        'query': request.query_string.decode(),
+        'body': anonymize_body(body) if body is not None else None,
+        'role': get_token_role(),
+        'status': response.status_code,
+        'duration_ms': round((time.perf_counter() - start) * 1000, 3)
+    }
+
+    with _traffic_capture_lock:
+        with open(app.config['TRAFFIC_CAPTURE_PATH'], 'a') as capture_file:
+            capture_file.write(json.dumps(record) + '\n')
+
+    return response
+
+
+# Per-request profiling
+
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]+-[0-9a-f]{8}$')
+PROFILE_FILES = {
+    'pstats': 'application/octet-stream',
+    'collapsed': 'text/plain',
+    'json': 'application/json',
+    'sql': 'application/json'
+}
+# One profiled request at a time: cProfile cannot run concurrently on 3.12+
+_profile_lock = threading.Lock()
+# SQL statements of the profiled request, per thread
+_profile_thread = threading.local()
+PROFILE_ENVIRON_KEY = 'lms.profile'
+
+
+class StackSampler(threading.Thread):
+    """
+    Periodically sample one thread's Python stack into collapsed-stack counts.
+
+    The output format ('frame;frame;frame count' per line) is the input
+    expected by flamegraph.pl and speedscope.
+    """
+
+    # Every sample needs the GIL, so sampling much faster than the
+    # interpreter's 5 ms switch interval mostly slows the profiled request
+    def __init__(self, thread_id, interval=0.005):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} '
+                             f'({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n'
+                       for stack, count in self.stacks.most_common())
+
+
+def has_profile_token():
+    """Check the request's X-Profile-Token header against PROFILE_TOKEN."""
+    expected = app.config.get('PROFILE_TOKEN')
+    provided = request.headers.get(PROFILE_HEADER, '')
+    return bool(expected) and hmac.compare_digest(provided, expected)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_profiled_query(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_profile_thread, 'sql', None) is not None:
+        conn.info.setdefault('profile_query_start', []).append(
+            time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_profiled_query(conn, cursor, statement, parameters, context, executemany):
+    sql = getattr(_profile_thread, 'sql', None)
+    starts = conn.info.get('profile_query_start')
+    if sql is None or not starts:
+        return
+    sql.append({
+        'statement': statement,
+        'duration_ms': round((time.perf_counter() - starts.pop()) * 1000, 3)
+    })
+
+
+@app.before_request
+def start_profiling():
+    forced = has_profile_token()
+    if not forced and random.random() >= app.config['PROFILE_SAMPLE_RATE']:
+        return
+    if not _profile_lock.acquire(blocking=False):
+        return
+
+    # Kept on the request itself, not g: batched sub-requests share g, and
+    # teardown may run after the app context is gone
+    _profile_thread.sql = []
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    profiler = cProfile.Profile()
+    request.environ[PROFILE_ENVIRON_KEY] = {
+        'id': f'{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}',
+        'profiler': profiler,
+        'sampler': sampler,
+        'sql': _profile_thread.sql,
+        'start': time.perf_counter()
+    }
+    profiler.enable()
+
+
+@app.after_request
+def finish_profile(response):
+    # Only stop measuring here; the files are written in teardown so that
+    # dumping them is not counted in the captured request duration
+    profile = request.environ.get(PROFILE_ENVIRON_KEY)
+    if profile is None:
+        return response
+
+    profile['profiler'].disable()
+    profile['sampler'].stop()
+    _profile_thread.sql = None
+    profile['duration'] = time.perf_counter() - profile['start']
+    profile['status'] = response.status_code
+    response.headers['X-Profile-Id'] = profile['id']
+    return response
+
+
+def write_profile(profile, error=None):
+    """Write a finished profile's pstats, collapsed stacks, SQL and metadata."""
+    folder = app.config['PROFILE_FOLDER']
+    base = os.path.join(folder, profile['id'])
+    os.makedirs(folder, exist_ok=True)
+
+    profile['profiler'].dump_stats(base + '.pstats')
+    with open(base + '.collapsed', 'w') as collapsed_file:
+        collapsed_file.write(profile['sampler'].collapsed())
+    with open(base + '.sql', 'w') as sql_file:
+        json.dump(profile['sql'], sql_file)
+    # Kept small so listing profiles never loads the SQL statements
+    with open(base + '.json', 'w') as meta_file:
+        json.dump({
+            'id': profile['id'],
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'status': profile.get('status', 500),
+            'error': repr(error) if error is not None else None,
+            'duration_ms': round(profile['duration'] * 1000, 3),
+            'created_at': datetime.utcnow().isoformat(),
+            'sql_count': len(profile['sql'])
+        }, meta_file)
+
+
+def prune_profiles():
+    """Delete the oldest profiles beyond PROFILE_MAX_COUNT."""
+    folder = app.config['PROFILE_FOLDER']
+    # Profile IDs start with a millisecond timestamp, so they sort by age
+    profile_ids = sorted(filename[:-len('.pstats')]
+                         for filename in os.listdir(folder)
+                         if filename.endswith('.pstats'))
+    excess = len(profile_ids) - app.config['PROFILE_MAX_COUNT']
+    for profile_id in profile_ids[:max(excess, 0)]:
+        for kind in PROFILE_FILES:
+            try:
+                os.remove(os.path.join(folder, f'{profile_id}.{kind}'))
+            except FileNotFoundError:
+                pass
+
+
+@app.teardown_request
+def stop_profiling(error=None):
+    # Runs even when the view raises, so the profiler and lock never leak
+    profile = request.environ.pop(PROFILE_ENVIRON_KEY, None)
+    if profile is None:
+        return
+
+    try:
+        profile['profiler'].disable()
+        profile['sampler'].stop()
+        profile.setdefault('duration', time.perf_counter() - profile['start'])
+        _profile_thread.sql = None
+        write_profile(profile, error)
+        prune_profiles()
+    finally:
+        _profile_lock.release()
+
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    if not has_profile_token():
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    folder = app.config['PROFILE_FOLDER']
+    if not os.path.isdir(folder):
+        return jsonify([])
+
+    profiles = []
+    for filename in sorted(os.listdir(folder), reverse=True):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(folder, filename)) as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(meta, dict) or 'id' not in meta:
+            continue
+        # Profiles written before the SQL moved to its own file
+        sql = meta.pop('sql', None)
+        if 'sql_count' not in meta and isinstance(sql, list):
+            meta['sql_count'] = len(sql)
+        profiles.append(meta)
+
+    return jsonify(profiles)
+
+
+@app.route('/api/admin/profiles/<profile_id>/<kind>', methods=['GET'])
+def get_profile(profile_id, kind):
+    if not has_profile_token():
+        return jsonify({'message': 'Unauthorized'}), 403
+
+    if not PROFILE_ID_PATTERN.match(profile_id) or (kind not in PROFILE_FILES and kind != 'stats'):
+        return jsonify({'message': 'Profile not found'}), 404
+
+    base = os.path.abspath(os.path.join(app.config['PROFILE_FOLDER'], profile_id))
+    if not os.path.exists(base + '.pstats'):
+        return jsonify({'message': 'Profile not found'}), 404
+
+    if kind == 'stats':
+        # Human-readable top functions by cumulative time
+        output = io.StringIO()
+        pstats.Stats(base + '.pstats', stream=output).sort_stats(
+            'cumulative').print_stats(40)
+        return output.getvalue(), 200, {'Content-Type': 'text/plain'}
+
+    return send_file(base + '.' + kind, mimetype=PROFILE_FILES[kind])
 
 # New routes for enhanced functionality
 
@@ -156,7 +624,9 @@ def get_student_submissions(student_id):
 @app.route('/api/courses/<int:course_id>/assignments', methods=['GET'])
 def get_course_assignments(course_id):
     # Vulnerability: No authentication check
-    assignments = Assignment.query.filter_by(course_id=course_id).all()
+    with course_data(course_id) as schema:
+        assignments = course_query(Assignment, schema).filter_by(
+            course_id=course_id).all()
 
     return jsonify([{
         'id': a.id,
@@ -165,6 +635,47 @@ def get_course_assignments(course_id):
         'due_date': a.due_date.isoformat()
     } for a in assignments])
 
+
+@app.route('/api/deadlines', methods=['GET'])
+def get_upcoming_deadlines():
+    try:
+        user = get_token_user()
+
+        if not user or user.role != 'student':
+            return jsonify({'message': 'Unauthorized'}), 403
+
+        limit = request.args.get('limit', 10, type=int)
+        days = request.args.get('days', 7, type=int)
+        if limit < 1 or days < 0:
+            return jsonify({'message': 'Invalid limit or days'}), 400
+        limit = min(limit, 100)
+        days = min(days, 366)
+
+        now = datetime.utcnow()
+        enrolled_course_ids = db.session.query(Enrollment.course_id).filter(
+            Enrollment.student_id == user.id)
+
+        # Single query over the (course_id, due_date) index for all enrollments
+        deadlines = db.session.query(Assignment, Course.title).join(
+            Course, Course.id == Assignment.course_id
+        ).filter(
+            Assignment.course_id.in_(enrolled_course_ids),
+            Assignment.due_date >= now,
+            Assignment.due_date <= now + timedelta(days=days)
+        ).order_by(Assignment.due_date).limit(limit).all()
+
+        return jsonify([{
+            'id': a.id,
+            'title': a.title,
+            'description': a.description,
+            'course_id': a.course_id,
+            'course_title': course_title,
+            'due_date': a.due_date.isoformat()
+        } for a, course_title in deadlines])
+
+    except jwt.InvalidTokenError:
+        return jsonify({'message': 'Invalid token'}), 401
+
 # Vulnerability: No input validation or sanitization
 # Modified registration endpoint with role-based signup
 
@@ -194,13 +705,10 @@ def register():
 
 @app.route('/api/courses', methods=['POST'])
 def create_course():
-    token = request.headers.get('Authorization', '').split('Bearer ')[-1]
     data = request.get_json()
 
     try:
-        payload = jwt.decode(
-            token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        user = User.query.filter_by(id=payload['user_id']).first()
+        user = get_token_user()
 
         if not user or user.role != 'teacher':
             return jsonify({'message': 'Unauthorized'}), 403
@@ -231,17 +739,17 @@ def create_course():
 @app.route('/api/enroll', methods=['POST'])
 def enroll_in_course():
     data = request.get_json()
-    token = request.headers.get('Authorization', '').split('Bearer ')[-1]
 
     try:
         # Vulnerability: No token expiration check
-        payload = jwt.decode(
-            token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        user = User.query.get(payload['user_id'])
+        user = get_token_user()
 
         if not user or user.role != 'student':
             return jsonify({'message': 'Unauthorized'}), 403
 
+        if get_archived_course(data['course_id']):
+            return jsonify({'message': 'Course is archived'}), 400
+
         # Vulnerability: No duplicate enrollment check
         enrollment = Enrollment(
             student_id=user.id,
@@ -261,12 +769,8 @@ def enroll_in_course():
 
 @app.route('/api/courses', methods=['GET'])
 def get_courses():
-    token = request.headers.get('Authorization', '').split('Bearer ')[-1]
-
     try:
-        payload = jwt.decode(
-            token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        user = User.query.filter_by(id=payload['user_id']).first()
+        user = get_token_user()
 
         if not user:
             return jsonify({'message': 'User not found'}), 404
@@ -382,9 +886,94 @@ def download_file(filename):
     return send_file(os.path.join(app.config['UPLOAD_FOLDER'], filename))
 
 
+# Tables whose rows archive.py deletes; they need IDs that are never reused
+ARCHIVED_MODELS = [Course, Assignment, Enrollment, Submission, Grade]
+
+
+def migrate_autoincrement():
+    """
+    Rebuild archivable tables created before they used AUTOINCREMENT.
+
+    Without AUTOINCREMENT SQLite reuses the highest freed ID, so a course
+    created after archiving could take an archived course's ID. After the
+    rebuild the ID sequences are also raised past every ID already in
+    ArchivedCourse and the term archives.
+    """
+    dialect = db.engine.dialect
+    with db.engine.begin() as connection:
+        for model in ARCHIVED_MODELS:
+            table = model.__table__
+            sql = connection.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (table.name,)).scalar()
+            if sql is None or 'AUTOINCREMENT' in sql.upper():
+                continue
+
+            existing = {row[1] for row in connection.exec_driver_sql(
+                f'PRAGMA table_info({table.name})')}
+            columns = ', '.join(
+                column.name for column in table.columns if column.name in existing)
+            rebuilt = f'{table.name}_rebuild'
+
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS {rebuilt}')
+            connection.exec_driver_sql(
+                str(CreateTable(table).compile(dialect=dialect)).replace(
+                    f'CREATE TABLE {table.name} ', f'CREATE TABLE {rebuilt} ', 1))
+            connection.exec_driver_sql(
+                f'INSERT INTO {rebuilt} ({columns}) '
+                f'SELECT {columns} FROM {table.name}')
+            connection.exec_driver_sql(f'DROP TABLE {table.name}')
+            connection.exec_driver_sql(
+                f'ALTER TABLE {rebuilt} RENAME TO {table.name}')
+
+        highest = {model.__tablename__: 0 for model in ARCHIVED_MODELS}
+        highest['course'] = connection.exec_driver_sql(
+            'SELECT COALESCE(MAX(course_id), 0) FROM archived_course').scalar()
+
+        folder = app.config['ARCHIVE_FOLDER']
+        archives = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                    if name.endswith('.db')] if os.path.isdir(folder) else []
+        for path in archives:
+            archive = sqlite3.connect(path)
+            try:
+                for name in highest:
+                    highest[name] = max(highest[name], archive.execute(
+                        f'SELECT COALESCE(MAX(id), 0) FROM {name}').fetchone()[0])
+            finally:
+                archive.close()
+
+        for name, seq in highest.items():
+            if not seq:
+                continue
+            current = connection.exec_driver_sql(
+                'SELECT seq FROM sqlite_sequence WHERE name = ?', (name,)).scalar()
+            if current is None:
+                connection.exec_driver_sql(
+                    'INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)',
+                    (name, seq))
+            elif current < seq:
+                connection.exec_driver_sql(
+                    'UPDATE sqlite_sequence SET seq = ? WHERE name = ?',
+                    (seq, name))
+
+
+def create_indexes():
+    """
+    Create any model index missing from the database.
+
+    db.create_all() skips tables that already exist, so indexes added to a
+    model after its table was created would otherwise never be built.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
 # Vulnerability: Command injection possible
 with app.app_context():
     db.create_all()
+    migrate_autoincrement()
+    create_indexes()
 
 
 @app.route('/api/export-grades', methods=['POST'])
@@ -400,12 +989,8 @@ def export_grades():
 
 @app.route('/api/courses/<int:course_id>/students', methods=['GET'])
 def get_course_students(course_id):
-    token = request.headers.get('Authorization', '').split('Bearer ')[-1]
-
     try:
-        payload = jwt.decode(
-            token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        user = User.query.filter_by(id=payload['user_id']).first()
+        user = get_token_user()
 
         if not user or user.role != 'teacher':
             return jsonify({'message': 'Unauthorized'}), 403
@@ -414,31 +999,33 @@ def get_course_students(course_id):
         if not is_course_teacher(course_id, user.id):
             return jsonify({'message': 'You are not authorized to view students in this course'}), 403
 
-        # Get enrollments for this course
-        enrollments = Enrollment.query.filter_by(course_id=course_id).all()
-        student_ids = [e.student_id for e in enrollments]
-
-        # Get students and their grades for this specific course
-        students_data = []
-        for student_id in student_ids:
-            student = User.query.get(student_id)
-            # Only get grades for this specific course
-            grades = Grade.query.join(Submission).filter(
-                Submission.student_id == student_id,
-                Submission.course_id == course_id
-            ).all()
-
-            grades_data = [{
-                'value': grade.value,
-                'feedback': grade.feedback,
-                'graded_at': grade.graded_at.isoformat()
-            } for grade in grades]
-
-            students_data.append({
-                'id': student.id,
-                'username': student.username,
-                'grades': grades_data
-            })
+        with course_data(course_id) as schema:
+            # Get enrollments for this course
+            enrollments = course_query(Enrollment, schema).filter_by(
+                course_id=course_id).all()
+            student_ids = [e.student_id for e in enrollments]
+
+            # Get students and their grades for this specific course
+            students_data = []
+            for student_id in student_ids:
+                student = User.query.get(student_id)
+                # Only get grades for this specific course
+                grades = course_query(Grade, schema).join(Submission).filter(
+                    Submission.student_id == student_id,
+                    Submission.course_id == course_id
+                ).all()
+
+                grades_data = [{
+                    'value': grade.value,
+                    'feedback': grade.feedback,
+                    'graded_at': grade.graded_at.isoformat()
+                } for grade in grades]
+
+                students_data.append({
+                    'id': student.id,
+                    'username': student.username,
+                    'grades': grades_data
+                })
 
         return jsonify(students_data)
 
@@ -448,12 +1035,8 @@ def get_course_students(course_id):
 
 @app.route('/api/courses/<int:course_id>/student-grades/<int:student_id>', methods=['GET'])
 def get_student_course_grades(course_id, student_id):
-    token = request.headers.get('Authorization', '').split('Bearer ')[-1]
-
     try:
-        payload = jwt.decode(
-            token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        user = User.query.filter_by(id=payload['user_id']).first()
+        user = get_token_user()
 
         # Check authorization
         if user.role == 'teacher' and not is_course_teacher(course_id, user.id):
@@ -462,10 +1045,11 @@ def get_student_course_grades(course_id, student_id):
             return jsonify({'message': 'Unauthorized'}), 403
 
         # Get grades for the specific course and student
-        grades = Grade.query.join(Submission).filter(
-            Submission.student_id == student_id,
-            Grade.course_id == course_id
-        ).order_by(Grade.graded_at.desc()).all()
+        with course_data(course_id) as schema:
+            grades = course_query(Grade, schema).join(Submission).filter(
+                Submission.student_id == student_id,
+                Grade.course_id == course_id
+            ).order_by(Grade.graded_at.desc()).all()
 
         return jsonify([{
             'id': grade.id,
@@ -477,18 +1061,199 @@ def get_student_course_grades(course_id, student_id):
     except jwt.InvalidTokenError:
         return jsonify({'message': 'Invalid token'}), 401
 
+
+# Cached grade analytics per course: the latest graded_at it reflects, the
+# (student_id, value) arrays, known usernames and the computed result (None
+# until recomputed). grade_student appends to the arrays so a new grade only
+# costs a NumPy recompute instead of reloading every grade row.
+#
+# The cache is per process and holds the least recently used courses only.
+# Cached and incrementally updated courses answer in tens of milliseconds at
+# hundreds of thousands of grades; a cold load (process start, eviction or a
+# grade written by another process) reads every grade row from SQLite and
+# takes a few hundred milliseconds at that size.
+_grade_analytics_cache = OrderedDict()
+_grade_analytics_lock = threading.Lock()
+GRADE_ANALYTICS_CACHE_SIZE = 32
+GRADE_PERCENTILES = [10, 25, 50, 75, 90]
+
+
+def get_cached_analytics(course_id: int):
+    """Return the cached analytics entry for a course, marking it recently used."""
+    with _grade_analytics_lock:
+        entry = _grade_analytics_cache.get(course_id)
+        if entry is not None:
+            _grade_analytics_cache.move_to_end(course_id)
+        return entry
+
+
+def store_cached_analytics(course_id: int, entry):
+    """Cache an analytics entry, evicting the least recently used courses."""
+    with _grade_analytics_lock:
+        _grade_analytics_cache[course_id] = entry
+        _grade_analytics_cache.move_to_end(course_id)
+        while len(_grade_analytics_cache) > GRADE_ANALYTICS_CACHE_SIZE:
+            _grade_analytics_cache.popitem(last=False)
+
+
+def record_grade_in_cache(grade, student_id: int):
+    """
+    Add a just-committed grade to the course's cached grade arrays.
+
+    The cache entry is dropped instead if it was already behind the database,
+    e.g. because another process added a grade, so the next analytics request
+    reloads it.
+
+    Args:
+        grade (Grade): The committed grade
+        student_id (int): The student the grade belongs to
+    """
+    entry = get_cached_analytics(grade.course_id)
+    if entry is None:
+        return
+
+    previous = db.session.query(db.func.max(Grade.graded_at)).filter(
+        Grade.course_id == grade.course_id, Grade.id != grade.id).scalar()
+    if previous != entry['latest']:
+        with _grade_analytics_lock:
+            _grade_analytics_cache.pop(grade.course_id, None)
+        return
+
+    # Replace rather than mutate so concurrent readers see a consistent entry
+    store_cached_analytics(grade.course_id, {
+        **entry,
+        'latest': grade.graded_at,
+        'student_ids': np.append(entry['student_ids'], student_id),
+        'values': np.append(entry['values'], float(grade.value)),
+        'result': None
+    })
+
+
+def compute_grade_analytics(student_ids, values):
+    """
+    Compute class statistics from parallel arrays of student IDs and grades.
+
+    Args:
+        student_ids (np.ndarray): Student ID for each grade row
+        values (np.ndarray): Grade value for each grade row
+
+    Returns:
+        dict: Histogram, summary statistics and per-student rank and z-score
+    """
+    if values.size == 0:
+        return {
+            'count': 0,
+            'mean': None,
+            'std': None,
+            'percentiles': {},
+            'histogram': {'bins': [], 'counts': []},
+            'students': []
+        }
+
+    upper = max(100, int(values.max()))
+    counts, bins = np.histogram(values, bins=np.arange(0, upper + 11, 10))
+
+    # Per-student averages without a Python loop over rows
+    unique_ids, inverse = np.unique(student_ids, return_inverse=True)
+    averages = (np.bincount(inverse, weights=values) /
+                np.bincount(inverse))
+
+    # Competition ranking: 1 + number of students with a higher average
+    ascending = np.sort(averages)
+    ranks = averages.size - np.searchsorted(ascending, averages, side='right') + 1
+
+    spread = averages.std()
+    z_scores = ((averages - averages.mean()) / spread if spread > 0
+                else np.zeros_like(averages))
+
+    return {
+        'count': int(values.size),
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'percentiles': {
+            str(p): float(v) for p, v in
+            zip(GRADE_PERCENTILES, np.percentile(values, GRADE_PERCENTILES))
+        },
+        'histogram': {'bins': bins.tolist(), 'counts': counts.tolist()},
+        'students': [{
+            'id': student_id,
+            'average': average,
+            'rank': rank,
+            'z_score': z_score
+        } for student_id, average, rank, z_score in zip(
+            unique_ids.tolist(), averages.tolist(),
+            ranks.tolist(), z_scores.tolist())]
+    }
+
+
+@app.route('/api/courses/<int:course_id>/grade-analytics', methods=['GET'])
+def get_course_grade_analytics(course_id):
+    try:
+        user = get_token_user()
+
+        if not user or user.role != 'teacher':
+            return jsonify({'message': 'Unauthorized'}), 403
+
+        if not is_course_teacher(course_id, user.id):
+            return jsonify({'message': 'You are not authorized to view analytics for this course'}), 403
+
+        with course_data(course_id) as schema:
+            # A newer grade invalidates the cached analytics for this course
+            latest = course_query(Grade, schema).with_entities(
+                db.func.max(Grade.graded_at)).filter(
+                Grade.course_id == course_id).scalar()
+
+            entry = get_cached_analytics(course_id)
+            if entry is None or entry['latest'] != latest:
+                # Plain DB-API tuples convert to an array far faster than ORM rows
+                cursor = db.session.connection().connection.cursor()
+                cursor.execute(
+                    f'SELECT s.student_id, g.value FROM {schema}.grade g '
+                    f'JOIN {schema}.submission s ON s.id = g.submission_id '
+                    'WHERE g.course_id = ?', (course_id,))
+                data = np.array(cursor.fetchall(),
+                                dtype=np.int64).reshape(-1, 2)
+                cursor.close()
+                entry = {
+                    'latest': latest,
+                    'student_ids': data[:, 0],
+                    'values': data[:, 1].astype(float),
+                    'usernames': {},
+                    'result': None
+                }
+
+        if entry['result'] is None:
+            result = compute_grade_analytics(
+                entry['student_ids'], entry['values'])
+
+            usernames = entry['usernames']
+            missing = [student['id'] for student in result['students']
+                       if student['id'] not in usernames]
+            if missing:
+                usernames = {**usernames, **dict(db.session.query(
+                    User.id, User.username).filter(User.id.in_(missing)).all())}
+            for student in result['students']:
+                student['username'] = usernames.get(student['id'])
+
+            result['course_id'] = course_id
+            entry = {**entry, 'usernames': usernames, 'result': result}
+
+        store_cached_analytics(course_id, entry)
+
+        return jsonify(entry['result'])
+
+    except jwt.InvalidTokenError:
+        return jsonify({'message': 'Invalid token'}), 401
+
 # Update the grade submission endpoint
 
 
 @app.route('/api/grade/student', methods=['POST'])
 def grade_student():
-    token = request.headers.get('Authorization', '').split('Bearer ')[-1]
     data = request.get_json()
 
     try:
-        payload = jwt.decode(
-            token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        user = User.query.filter_by(id=payload['user_id']).first()
+        user = get_token_user()
 
         if not user or user.role != 'teacher':
             return jsonify({'message': 'Unauthorized'}), 403
@@ -497,6 +1262,9 @@ def grade_student():
         if not is_course_teacher(data['course_id'], user.id):
             return jsonify({'message': 'Unauthorized to grade in this course'}), 403
 
+        if get_archived_course(data['course_id']):
+            return jsonify({'message': 'Course is archived'}), 400
+
         # First check if student is enrolled in this course
         enrollment = Enrollment.query.filter_by(
             student_id=data['student_id'],
@@ -525,6 +1293,8 @@ def grade_student():
         db.session.add(grade)
         db.session.commit()
 
+        record_grade_in_cache(grade, submission.student_id)
+
         return jsonify({'message': 'Grade submitted successfully'})
 
     except Exception as e:
@@ -533,12 +1303,94 @@ def grade_student():
         return jsonify({'message': 'Error submitting grade'}), 500
 
 
+# Upper bound on sub-requests so one batch call cannot monopolise a worker
+BATCH_MAX_REQUESTS = 20
+
+
+@app.route('/api/batch', methods=['POST'])
+def batch_requests():
+    """
+    Run several read-only /api/* calls in one round trip.
+
+    The body is {"requests": [{"path": "/api/courses"}, ...]}. The bearer
+    token is checked once and every sub-request runs in this request's app
+    context, so they share the decoded user and the database session.
+    """
+    data = request.get_json(silent=True) or {}
+    sub_requests = data.get('requests')
+
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return jsonify({'message': 'requests must be a non-empty list'}), 400
+    if len(sub_requests) > BATCH_MAX_REQUESTS:
+        return jsonify({'message': f'At most {BATCH_MAX_REQUESTS} requests per batch'}), 400
+
+    try:
+        user = get_token_user()
+        if not user:
+            return jsonify({'message': 'User not found'}), 404
+    except jwt.InvalidTokenError:
+        return jsonify({'message': 'Invalid token'}), 401
+
+    headers = {'Authorization': request.headers.get('Authorization', '')}
+    responses = []
+    for sub_request in sub_requests:
+        if not isinstance(sub_request, dict):
+            sub_request = {}
+        path = sub_request.get('path', '')
+        method = sub_request.get('method', 'GET')
+
+        if not isinstance(path, str) or not isinstance(method, str):
+            responses.append({'path': path, 'status': 400,
+                              'body': {'message': 'path and method must be strings'}})
+            continue
+        method = method.upper()
+
+        if not path.startswith('/api/') or path.startswith('/api/batch'):
+            responses.append({'path': path, 'status': 400,
+                              'body': {'message': 'Unsupported path'}})
+            continue
+        if method != 'GET':
+            responses.append({'path': path, 'status': 405,
+                              'body': {'message': 'Only GET requests can be batched'}})
+            continue
+
+        with app.test_request_context(path, method=method, headers=headers):
+            try:
+                response = app.make_response(app.dispatch_request())
+            except HTTPException as e:
+                response = e.get_response()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error in batched request {path}: {str(e)}")
+                response = jsonify({'message': 'Internal server error'})
+                response.status_code = 500
+
+            try:
+                # Streamed responses such as send_file cannot be buffered here
+                if response.direct_passthrough:
+                    responses.append({'path': path, 'status': 415,
+                                      'body': {'message': 'Only JSON routes can be batched'}})
+                    continue
+                body = response.get_json(silent=True)
+                responses.append({
+                    'path': path,
+                    'status': response.status_code,
+                    'body': body if body is not None else response.get_data(as_text=True)
+                })
+            finally:
+                response.close()
+
+    return jsonify({'responses': responses})
+
+
 if __name__ == '__main__':
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
 
     with app.app_context():
         db.create_all()
+        migrate_autoincrement()
+        create_indexes()
 
         # Create default teacher only if they don't exist
         default_teacher = User.query.filter_by(username='john.smith').first()
@@ -0,0 +1,205 @@
+"""
+Move finished courses and their dependent rows into per-term archives.
+
+Each term gets its own SQLite file in ARCHIVE_FOLDER with the same course,
+assignment, enrollment, submission and grade tables as learning.db. Rows
+are copied and deleted in small batches, each batch in a single
+transaction spanning both databases, so an interrupted run can simply be
+started again and picks up where it stopped. The read endpoints attach the
+archive on demand once a course is marked archived.
+
+Example:
+    python archive.py 2024-spring --course-id 3 --course-id 4
+    python archive.py 2024-spring --finished-before 2024-06-30 --vacuum
+"""
+import argparse
+import os
+from datetime import datetime
+
+from sqlalchemy import create_engine
+
+from app import (app, db, ArchivedCourse, Assignment, Course, Enrollment,
+                 Grade, Submission, ARCHIVED_MODELS, archive_path)
+
+# Dependent tables, children first so no row is left pointing at a moved one
+DEPENDENT_TABLES = [Grade, Submission, Enrollment, Assignment]
+
+
+class ArchiveConflictError(Exception):
+    """An archive already holds a row with the same ID for another course."""
+
+
+def create_archive(term: str) -> str:
+    """
+    Create the archive database for a term if it does not exist yet.
+
+    Args:
+        term (str): Term name, e.g. '2024-spring'
+
+    Returns:
+        str: Path of the archive database
+    """
+    path = archive_path(term)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(
+        engine, tables=[model.__table__ for model in ARCHIVED_MODELS])
+    engine.dispose()
+    return path
+
+
+def find_finished_courses(before: datetime) -> list:
+    """Return IDs of hot courses whose last assignment was due before a date."""
+    rows = db.session.query(Assignment.course_id).join(
+        Course, Course.id == Assignment.course_id
+    ).group_by(Assignment.course_id).having(
+        db.func.max(Assignment.due_date) < before).all()
+    return [course_id for (course_id,) in rows]
+
+
+def _copy_and_delete(connection, table, ids, course_id, owner_column='course_id'):
+    columns = ', '.join(column.name for column in table.columns)
+    placeholders = ', '.join('?' for _ in ids)
+
+    # Rows already copied by an interrupted run are skipped below; any other
+    # ID clash would silently drop this course's row, so stop instead
+    conflict = connection.exec_driver_sql(
+        f'SELECT id FROM archive.{table.name} WHERE id IN ({placeholders}) '
+        f'AND {owner_column} != ? LIMIT 1', (*ids, course_id)).scalar()
+    if conflict is not None:
+        raise ArchiveConflictError(
+            f'{table.name} {conflict} already exists in the archive '
+            f'for another course')
+
+    connection.exec_driver_sql(
+        f'INSERT OR IGNORE INTO archive.{table.name} ({columns}) '
+        f'SELECT {columns} FROM main.{table.name} WHERE id IN ({placeholders})',
+        tuple(ids))
+    connection.exec_driver_sql(
+        f'DELETE FROM main.{table.name} WHERE id IN ({placeholders})',
+        tuple(ids))
+
+
+def move_rows(connection, table, course_id: int, batch_size: int) -> int:
+    """
+    Move a course's rows of one table to the attached archive in batches.
+
+    Args:
+        connection: Connection with the term archive attached as 'archive'
+        table: SQLAlchemy table with a course_id column
+        course_id (int): The ID of the course being archived
+        batch_size (int): Rows moved per transaction
+
+    Returns:
+        int: Number of rows moved
+    """
+    moved = 0
+    while True:
+        ids = [row[0] for row in connection.exec_driver_sql(
+            f'SELECT id FROM main.{table.name} WHERE course_id = ? LIMIT ?',
+            (course_id, batch_size))]
+        if not ids:
+            return moved
+
+        _copy_and_delete(connection, table, ids, course_id)
+        connection.commit()
+        moved += len(ids)
+
+
+def archive_course(course_id: int, term: str, batch_size: int = 1000) -> dict:
+    """
+    Move a course and all its dependent rows into the term archive.
+
+    Safe to re-run after an interruption: the course stays 'in_progress'
+    in ArchivedCourse until the final batch, and rows already copied for
+    this course are skipped. A row whose ID is taken in the archive by
+    another course raises ArchiveConflictError and is left in place.
+
+    Args:
+        course_id (int): The ID of the course to archive
+        term (str): Term archive the course belongs to
+        batch_size (int): Rows moved per transaction
+
+    Returns:
+        dict: Number of rows moved per table
+    """
+    entry = db.session.get(ArchivedCourse, course_id)
+    if entry is None:
+        course = db.session.get(Course, course_id)
+        if course is None:
+            raise ValueError(f'Course {course_id} not found')
+        entry = ArchivedCourse(course_id=course.id, term=term,
+                               title=course.title, teacher_id=course.teacher_id)
+        db.session.add(entry)
+        db.session.commit()
+    elif entry.term != term:
+        raise ValueError(
+            f'Course {course_id} is already being archived to {entry.term}')
+    elif entry.status == 'archived':
+        if db.session.get(Course, course_id) is not None:
+            raise ArchiveConflictError(
+                f'Course ID {course_id} was reused after being archived')
+        return {}
+
+    path = create_archive(term)
+    moved = {}
+
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('ATTACH DATABASE ? AS archive', (path,))
+        try:
+            for model in DEPENDENT_TABLES:
+                moved[model.__tablename__] = move_rows(
+                    connection, model.__table__, course_id, batch_size)
+
+            # The course row and the status flip commit together
+            _copy_and_delete(connection, Course.__table__, [course_id],
+                             course_id, owner_column='id')
+            connection.exec_driver_sql(
+                "UPDATE main.archived_course SET status = 'archived' "
+                'WHERE course_id = ?', (course_id,))
+            connection.commit()
+            moved[Course.__tablename__] = 1
+        finally:
+            # A failed batch still holds the archive open until rolled back
+            connection.rollback()
+            connection.exec_driver_sql('DETACH DATABASE archive')
+
+    db.session.expire_all()
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Move finished courses to a per-term archive database')
+    parser.add_argument('term', help="Term name, e.g. '2024-spring'")
+    parser.add_argument('--course-id', type=int, action='append', default=[],
+                        help='Course to archive (repeatable)')
+    parser.add_argument('--finished-before',
+                        type=datetime.fromisoformat,
+                        help='Archive every course whose last assignment '
+                             'was due before this date')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--vacuum', action='store_true',
+                        help='Reclaim space in learning.db afterwards')
+    args = parser.parse_args()
+
+    with app.app_context():
+        course_ids = list(args.course_id)
+        if args.finished_before:
+            course_ids += find_finished_courses(args.finished_before)
+        # Resume any course left half-moved by an earlier run
+        course_ids += [entry.course_id for entry in ArchivedCourse.query.filter_by(
+            term=args.term, status='in_progress')]
+
+        for course_id in dict.fromkeys(course_ids):
+            moved = archive_course(course_id, args.term, args.batch_size)
+            print(f'Course {course_id}: {moved or "already archived"}')
+
+        if args.vacuum:
+            with db.engine.connect() as connection:
+                connection.exec_driver_sql('VACUUM')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Replay a captured traffic trace against a running backend instance.
+
+Traces are the JSON Lines files written by the app when
+TRAFFIC_CAPTURE_PATH is set. Requests are re-issued with their original
+relative timing (optionally sped up) and a bounded number of concurrent
+workers, then throughput, error rate and latency percentiles are reported
+per route.
+
+Example:
+    python replay.py traffic.jsonl --base-url http://localhost:4000 \\
+        --concurrency 16 --speedup 10 \\
+        --teacher john.smith:teacher123 --student alice:alice123
+"""
+import argparse
+import json
+import math
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def load_trace(path):
+    """
+    Load a captured trace, ordered by capture time.
+
+    Args:
+        path (str): Path to the JSON Lines trace file
+
+    Returns:
+        list: Captured request records
+    """
+    with open(path) as trace_file:
+        records = [json.loads(line) for line in trace_file if line.strip()]
+    return sorted(records, key=lambda r: r['ts'])
+
+
+def login(base_url, credentials):
+    """Log in with 'username:password' credentials and return a JWT."""
+    username, password = credentials.split(':', 1)
+    request = urllib.request.Request(
+        base_url + '/api/login',
+        data=json.dumps({'username': username,
+                         'password': password}).encode(),
+        headers={'Content-Type': 'application/json'},
+        method='POST')
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())['token']
+
+
+def send(base_url, record, tokens, timeout):
+    """
+    Re-issue one captured request.
+
+    Args:
+        base_url (str): Base URL of the target instance
+        record (dict): Captured request record
+        tokens (dict): Role -> bearer token used for authenticated requests
+        timeout (float): Per-request timeout in seconds
+
+    Returns:
+        int: Status code, or None on transport failure
+    """
+    url = base_url + record['path']
+    if record.get('query'):
+        url += '?' + record['query']
+
+    headers = {}
+    data = None
+    if record.get('body') is not None:
+        data = json.dumps(record['body']).encode()
+        headers['Content-Type'] = 'application/json'
+    if tokens.get(record.get('role')):
+        headers['Authorization'] = f"Bearer {tokens[record['role']]}"
+
+    request = urllib.request.Request(
+        url, data=data, headers=headers, method=record['method'])
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, OSError):
+        return None
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def summarize(results, elapsed):
+    """
+    Aggregate replay results per route.
+
+    Args:
+        results (list): (route, status, latency_ms) tuples
+        elapsed (float): Wall-clock duration of the replay in seconds
+
+    Returns:
+        dict: Route -> throughput, error rate and latency percentiles
+    """
+    by_route = defaultdict(list)
+    for route, status, latency in results:
+        by_route[route].append((status, latency))
+
+    summary = {}
+    for route, samples in sorted(by_route.items()):
+        latencies = sorted(latency for _, latency in samples)
+        errors = sum(1 for status, _ in samples
+                     if status is None or status >= 500)
+        summary[route] = {
+            'requests': len(samples),
+            'throughput_rps': len(samples) / elapsed if elapsed else None,
+            'error_rate': errors / len(samples),
+            'client_errors': sum(1 for status, _ in samples
+                                 if status is not None and 400 <= status < 500),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99)
+        }
+    return summary
+
+
+def replay(records, base_url, tokens, concurrency=8, speedup=1.0, timeout=30):
+    """
+    Replay records with their original pacing divided by speedup.
+
+    Latency is measured from each request's scheduled send time, not from
+    when a worker picks it up, so time spent queued behind a saturated pool
+    counts against the server instead of being silently dropped.
+
+    Returns:
+        tuple: (list of (route, status, latency_ms), elapsed seconds)
+    """
+    results = []
+    results_lock = threading.Lock()
+
+    def run(record, scheduled):
+        status = send(base_url, record, tokens, timeout)
+        latency = (time.perf_counter() - scheduled) * 1000
+        route = f"{record['method']} {record.get('route') or record['path']}"
+        with results_lock:
+            results.append((route, status, latency))
+
+    if not records:
+        return results, 0.0
+
+    first_ts = records[0]['ts']
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for record in records:
+            scheduled = start + (record['ts'] - first_ts) / speedup
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(run, record, scheduled)
+
+    return results, time.perf_counter() - start
+
+
+def print_summary(summary):
+    header = f"{'route':<55} {'reqs':>6} {'rps':>8} {'err%':>6} " \
+             f"{'p50':>8} {'p95':>8} {'p99':>8}"
+    print(header)
+    print('-' * len(header))
+    for route, stats in summary.items():
+        print(f"{route:<55} {stats['requests']:>6} "
+              f"{stats['throughput_rps']:>8.1f} "
+              f"{stats['error_rate'] * 100:>6.1f} "
+              f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+              f"{stats['p99_ms']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay a captured traffic trace')
+    parser.add_argument('trace', help='JSON Lines trace file')
+    parser.add_argument('--base-url', default='http://localhost:4000')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--speedup', type=float, default=1.0,
+                        help='Divide the captured inter-request gaps by this')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--teacher', help='username:password for teacher requests')
+    parser.add_argument('--student', help='username:password for student requests')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the summary as JSON')
+    args = parser.parse_args()
+
+    tokens = {}
+    if args.teacher:
+        tokens['teacher'] = login(args.base_url, args.teacher)
+    if args.student:
+        tokens['student'] = login(args.base_url, args.student)
+
+    records = load_trace(args.trace)
+    results, elapsed = replay(records, args.base_url, tokens,
+                              args.concurrency, args.speedup, args.timeout)
+    summary = summarize(results, elapsed)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+        total_errors = sum(s['error_rate'] * s['requests']
+                           for s in summary.values())
+        print(f"\n{len(results)} requests in {elapsed:.2f}s "
+              f"({len(results) / elapsed if elapsed else 0:.1f} req/s), "
+              f"{total_errors:.0f} errors")
+
+
+if __name__ == '__main__':
+    main()
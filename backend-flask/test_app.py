@@ -1,7 +1,10 @@
 import pytest
-from app import app, db, User, Course, Enrollment
+from app import (app, db, User, Course, Enrollment, Assignment, Submission,
+                 Grade, create_indexes)
 import json
 import jwt
+import threading
+import time
 from datetime import datetime, timedelta
 
 
@@ -195,3 +198,642 @@ def test_unauthorized_access(client):
                            }
                            )
     assert response.status_code == 401
+
+
+def test_upcoming_deadlines(client):
+    client.post('/api/register', json={
+        'username': 'student2', 'password': 'pass123', 'role': 'student'})
+    token = client.post('/api/login', json={
+        'username': 'student2', 'password': 'pass123'}).get_json()['token']
+
+    with app.app_context():
+        teacher = User(username='teacher2', password='pass123', role='teacher')
+        db.session.add(teacher)
+        db.session.commit()
+        enrolled = Course(title='Enrolled', teacher_id=teacher.id)
+        other = Course(title='Other', teacher_id=teacher.id)
+        db.session.add_all([enrolled, other])
+        db.session.commit()
+        student = User.query.filter_by(username='student2').first()
+        db.session.add(Enrollment(student_id=student.id, course_id=enrolled.id))
+        now = datetime.utcnow()
+        db.session.add_all([
+            Assignment(title='Later', course_id=enrolled.id,
+                       due_date=now + timedelta(days=3)),
+            Assignment(title='Soon', course_id=enrolled.id,
+                       due_date=now + timedelta(days=1)),
+            Assignment(title='Past', course_id=enrolled.id,
+                       due_date=now - timedelta(days=1)),
+            Assignment(title='Next month', course_id=enrolled.id,
+                       due_date=now + timedelta(days=30)),
+            Assignment(title='Not enrolled', course_id=other.id,
+                       due_date=now + timedelta(days=2)),
+        ])
+        db.session.commit()
+
+    response = client.get('/api/deadlines?days=7',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    titles = [a['title'] for a in response.get_json()]
+    assert titles == ['Soon', 'Later']
+
+    response = client.get('/api/deadlines?days=7&limit=1',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert [a['title'] for a in response.get_json()] == ['Soon']
+
+    response = client.get('/api/deadlines?days=1000000',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert [a['title'] for a in response.get_json()] == [
+        'Soon', 'Later', 'Next month']
+
+
+def test_create_indexes_adds_missing_indexes(client):
+    with app.app_context():
+        db.session.execute(db.text('DROP INDEX ix_assignment_course_due'))
+        db.session.execute(db.text('DROP INDEX ix_enrollment_student_course'))
+        db.session.execute(db.text('DROP INDEX ix_grade_course_graded'))
+        db.session.commit()
+
+        create_indexes()
+
+        names = {row[0] for row in db.session.execute(db.text(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"))}
+        assert {'ix_assignment_course_due', 'ix_enrollment_student_course',
+                'ix_grade_course_graded'} <= names
+
+
+def test_course_grade_analytics(client, auth_token):
+    with app.app_context():
+        teacher = User.query.filter_by(username='testuser').first()
+        course = Course(title='Stats', teacher_id=teacher.id)
+        alice = User(username='alice', password='pass123', role='student')
+        bob = User(username='bob', password='pass123', role='student')
+        db.session.add_all([course, alice, bob])
+        db.session.commit()
+        for student, value in [(alice, 90), (alice, 70), (bob, 60)]:
+            submission = Submission(student_id=student.id, course_id=course.id)
+            db.session.add(submission)
+            db.session.flush()
+            db.session.add(Grade(submission_id=submission.id,
+                                 course_id=course.id, value=value))
+        db.session.commit()
+        course_id, alice_id = course.id, alice.id
+
+    response = client.get(f'/api/courses/{course_id}/grade-analytics',
+                          headers={'Authorization': f'Bearer {auth_token}'})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['count'] == 3
+    assert data['mean'] == pytest.approx(220 / 3)
+    assert data['percentiles']['50'] == 70
+    assert sum(data['histogram']['counts']) == 3
+
+    students = {s['username']: s for s in data['students']}
+    assert students['alice']['id'] == alice_id
+    assert students['alice']['average'] == 80
+    assert students['alice']['rank'] == 1
+    assert students['bob']['rank'] == 2
+    assert students['alice']['z_score'] == pytest.approx(1.0)
+
+
+def test_grade_analytics_updates_after_new_grade(client, auth_token):
+    headers = {'Authorization': f'Bearer {auth_token}'}
+    with app.app_context():
+        teacher = User.query.filter_by(username='testuser').first()
+        course = Course(title='Live Stats', teacher_id=teacher.id)
+        student = User(username='carol', password='pass123', role='student')
+        db.session.add_all([course, student])
+        db.session.commit()
+        db.session.add(Enrollment(student_id=student.id, course_id=course.id))
+        db.session.commit()
+        course_id, student_id = course.id, student.id
+
+    def grade(value):
+        response = client.post('/api/grade/student', headers=headers, json={
+            'course_id': course_id, 'student_id': student_id,
+            'grade': value, 'feedback': 'ok'})
+        assert response.status_code == 200
+
+    url = f'/api/courses/{course_id}/grade-analytics'
+    grade(40)
+    assert client.get(url, headers=headers).get_json()['mean'] == 40
+
+    # The new grade is appended to the cached arrays, not missed
+    grade(80)
+    data = client.get(url, headers=headers).get_json()
+    assert data['count'] == 2
+    assert data['mean'] == 60
+    assert data['students'][0]['username'] == 'carol'
+
+
+def test_traffic_capture_records_anonymized_requests(client, tmp_path):
+    capture_path = tmp_path / 'traffic.jsonl'
+    app.config['TRAFFIC_CAPTURE_PATH'] = str(capture_path)
+    try:
+        client.post('/api/register', json={
+            'username': 'captured', 'password': 'secret1', 'role': 'student'})
+    finally:
+        app.config['TRAFFIC_CAPTURE_PATH'] = None
+
+    records = [json.loads(line) for line in capture_path.read_text().splitlines()]
+    assert len(records) == 1
+    record = records[0]
+    assert record['method'] == 'POST'
+    assert record['route'] == '/api/register'
+    assert record['status'] == 200
+    assert record['body']['password'] == '***'
+    assert record['body']['username'] != 'captured'
+    assert record['body']['role'] == 'student'
+    assert record['duration_ms'] >= 0
+
+
+def test_replay_summary():
+    from replay import summarize
+
+    summary = summarize([
+        ('GET /api/courses', 200, 10.0),
+        ('GET /api/courses', 200, 30.0),
+        ('GET /api/courses', 500, 20.0),
+        ('POST /api/login', None, 5.0),
+    ], elapsed=2.0)
+
+    courses = summary['GET /api/courses']
+    assert courses['requests'] == 3
+    assert courses['throughput_rps'] == 1.5
+    assert courses['error_rate'] == pytest.approx(1 / 3)
+    assert courses['p50_ms'] == 20.0
+    assert courses['p99_ms'] == 30.0
+    assert summary['POST /api/login']['error_rate'] == 1.0
+
+
+def test_replay_percentile_is_nearest_rank():
+    from replay import percentile
+
+    assert percentile([1, 2, 3, 4, 5], 50) == 3
+    assert percentile(list(range(1, 31)), 95) == 29
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) is None
+
+
+def test_replay_counts_queueing_delay(monkeypatch):
+    import replay
+
+    # A single worker serving three simultaneous 50 ms requests: the last one
+    # waits for the other two, and that wait belongs in its latency
+    monkeypatch.setattr(replay, 'send', lambda *args: time.sleep(0.05) or 200)
+    records = [{'ts': 0.0, 'method': 'GET', 'path': '/api'}] * 3
+
+    results, _ = replay.replay(records, 'http://stub', {}, concurrency=1)
+    latencies = sorted(latency for _, _, latency in results)
+    assert latencies[-1] >= 140
+
+
+def test_replay_against_running_app(client):
+    import replay
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        client.post('/api/register', json={
+            'username': 'replayer', 'password': 'pass123', 'role': 'student'})
+        tokens = {'student': replay.login(base_url, 'replayer:pass123')}
+
+        records = [
+            {'ts': 0.0, 'method': 'GET', 'path': '/api', 'route': '/api'},
+            {'ts': 0.01, 'method': 'GET', 'path': '/api/courses',
+             'route': '/api/courses', 'role': 'student'},
+            {'ts': 0.02, 'method': 'GET', 'path': '/api/courses',
+             'route': '/api/courses'},
+        ]
+        results, elapsed = replay.replay(records, base_url, tokens,
+                                         concurrency=2, speedup=10)
+    finally:
+        server.shutdown()
+
+    summary = replay.summarize(results, elapsed)
+    assert summary['GET /api']['requests'] == 1
+    assert summary['GET /api']['error_rate'] == 0
+    assert summary['GET /api/courses']['requests'] == 2
+    # The record without a role replays unauthenticated and gets a 401
+    assert summary['GET /api/courses']['client_errors'] == 1
+
+
+def test_archive_course_moves_rows_and_reads_transparently(client, auth_token, tmp_path,
+                                                          monkeypatch):
+    from archive import archive_course
+
+    monkeypatch.setitem(app.config, 'ARCHIVE_FOLDER', str(tmp_path))
+    with app.app_context():
+        teacher = User.query.filter_by(username='testuser').first()
+        student = User(username='archived', password='pass123', role='student')
+        course = Course(title='Old Course', teacher_id=teacher.id)
+        db.session.add_all([student, course])
+        db.session.commit()
+        db.session.add(Enrollment(student_id=student.id, course_id=course.id))
+        db.session.add(Assignment(title='Final', course_id=course.id,
+                                  due_date=datetime(2024, 5, 1)))
+        for value in (55, 65, 75):
+            submission = Submission(student_id=student.id, course_id=course.id)
+            db.session.add(submission)
+            db.session.flush()
+            db.session.add(Grade(submission_id=submission.id,
+                                 course_id=course.id, value=value))
+        db.session.commit()
+        course_id, student_id = course.id, student.id
+
+        moved = archive_course(course_id, '2024-spring', batch_size=2)
+        assert moved == {'grade': 3, 'submission': 3, 'enrollment': 1,
+                         'assignment': 1, 'course': 1}
+        # Re-running is a no-op once the course is archived
+        assert archive_course(course_id, '2024-spring') == {}
+
+        assert db.session.get(Course, course_id) is None
+        assert Grade.query.filter_by(course_id=course_id).count() == 0
+        assert (tmp_path / '2024-spring.db').exists()
+
+    headers = {'Authorization': f'Bearer {auth_token}'}
+    response = client.get(f'/api/courses/{course_id}/assignments')
+    assert [a['title'] for a in response.get_json()] == ['Final']
+
+    response = client.get(
+        f'/api/courses/{course_id}/student-grades/{student_id}', headers=headers)
+    assert response.status_code == 200
+    assert sorted(g['value'] for g in response.get_json()) == [55, 65, 75]
+
+    response = client.get(f'/api/courses/{course_id}/students', headers=headers)
+    assert response.status_code == 200
+    assert len(response.get_json()[0]['grades']) == 3
+
+    response = client.get(
+        f'/api/courses/{course_id}/grade-analytics', headers=headers)
+    assert response.get_json()['mean'] == 65
+
+
+def test_batch_requests(client, auth_token):
+    client.post('/api/courses',
+                headers={'Authorization': f'Bearer {auth_token}'},
+                json={'title': 'Batched Course', 'description': 'Test'})
+
+    response = client.post('/api/batch',
+                           headers={'Authorization': f'Bearer {auth_token}'},
+                           json={'requests': [
+                               {'path': '/api/courses'},
+                               {'path': '/api/courses/1/assignments'},
+                               {'path': '/api/does-not-exist'},
+                               {'path': '/api/courses', 'method': 'POST'},
+                           ]})
+    assert response.status_code == 200
+    results = response.get_json()['responses']
+    assert results[0]['status'] == 200
+    assert results[0]['body'][0]['title'] == 'Batched Course'
+    assert results[1]['status'] == 200
+    assert results[1]['body'] == []
+    assert results[2]['status'] == 404
+    assert results[3]['status'] == 405
+
+
+def test_batch_requests_rejects_malformed_entries(client, auth_token):
+    response = client.post('/api/batch',
+                           headers={'Authorization': f'Bearer {auth_token}'},
+                           json={'requests': [
+                               {'path': 5},
+                               {'path': '/api/courses', 'method': None},
+                               'not-an-object',
+                               {'path': '/api/courses'},
+                           ]})
+    assert response.status_code == 200
+    statuses = [r['status'] for r in response.get_json()['responses']]
+    assert statuses == [400, 400, 400, 200]
+
+
+def test_batch_requests_rejects_file_responses(client, auth_token, tmp_path,
+                                               monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    (tmp_path / 'notes.txt').write_text('not json')
+
+    response = client.post('/api/batch',
+                           headers={'Authorization': f'Bearer {auth_token}'},
+                           json={'requests': [
+                               {'path': '/api/download/notes.txt'},
+                               {'path': '/api/courses'},
+                           ]})
+    assert response.status_code == 200
+    statuses = [r['status'] for r in response.get_json()['responses']]
+    assert statuses == [415, 200]
+
+
+def test_batch_requests_requires_token(client):
+    response = client.post('/api/batch',
+                           json={'requests': [{'path': '/api/courses'}]})
+    assert response.status_code == 401
+
+
+def test_request_profiling_and_admin_endpoints(client, auth_token, tmp_path,
+                                               monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILE_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'PROFILE_TOKEN', 'profile-secret')
+    profile_headers = {'X-Profile-Token': 'profile-secret'}
+
+    # Without the token nothing is profiled and the admin API is closed
+    response = client.get('/api/courses',
+                          headers={'Authorization': f'Bearer {auth_token}'})
+    assert 'X-Profile-Id' not in response.headers
+    assert client.get('/api/admin/profiles').status_code == 403
+
+    response = client.get('/api/courses', headers={
+        'Authorization': f'Bearer {auth_token}', **profile_headers})
+    assert response.status_code == 200
+    profile_id = response.headers['X-Profile-Id']
+
+    profiles = client.get('/api/admin/profiles',
+                          headers=profile_headers).get_json()
+    assert [p['id'] for p in profiles] == [profile_id]
+    assert profiles[0]['route'] == '/api/courses'
+    assert profiles[0]['sql_count'] > 0
+
+    sql = client.get(f'/api/admin/profiles/{profile_id}/sql',
+                     headers=profile_headers).get_json()
+    assert any('FROM course' in q['statement'] for q in sql)
+
+    stats = client.get(f'/api/admin/profiles/{profile_id}/stats',
+                       headers=profile_headers)
+    assert b'get_courses' in stats.data
+
+    response = client.get(f'/api/admin/profiles/{profile_id}/collapsed',
+                          headers=profile_headers)
+    assert response.status_code == 200
+    assert client.get('/api/admin/profiles/../secret/json',
+                      headers=profile_headers).status_code == 404
+
+
+def test_archive_course_resumes_after_interruption(client, auth_token, tmp_path,
+                                                   monkeypatch):
+    import archive
+
+    monkeypatch.setitem(app.config, 'ARCHIVE_FOLDER', str(tmp_path))
+    headers = {'Authorization': f'Bearer {auth_token}'}
+    with app.app_context():
+        teacher = User.query.filter_by(username='testuser').first()
+        student = User(username='resumed', password='pass123', role='student')
+        course = Course(title='Interrupted Course', teacher_id=teacher.id)
+        db.session.add_all([student, course])
+        db.session.commit()
+        db.session.add(Enrollment(student_id=student.id, course_id=course.id))
+        for value in (50, 70):
+            submission = Submission(student_id=student.id, course_id=course.id)
+            db.session.add(submission)
+            db.session.flush()
+            db.session.add(Grade(submission_id=submission.id,
+                                 course_id=course.id, value=value))
+        db.session.commit()
+        course_id, student_id = course.id, student.id
+
+        # Fail once the grades have moved but before the submissions do
+        move_rows = archive.move_rows
+
+        def interrupted_move_rows(connection, table, *args):
+            if table.name == 'submission':
+                raise RuntimeError('interrupted')
+            return move_rows(connection, table, *args)
+
+        monkeypatch.setattr(archive, 'move_rows', interrupted_move_rows)
+        with pytest.raises(RuntimeError):
+            archive.archive_course(course_id, '2024-autumn', batch_size=1)
+        monkeypatch.setattr(archive, 'move_rows', move_rows)
+
+        entry = db.session.get(archive.ArchivedCourse, course_id)
+        assert entry.status == 'in_progress'
+        assert Grade.query.filter_by(course_id=course_id).count() == 0
+
+    # Half-moved courses refuse reads and writes
+    response = client.get(
+        f'/api/courses/{course_id}/student-grades/{student_id}', headers=headers)
+    assert response.status_code == 503
+    response = client.post('/api/grade/student', headers=headers, json={
+        'course_id': course_id, 'student_id': student_id,
+        'grade': 90, 'feedback': 'late'})
+    assert response.status_code == 400
+
+    with app.app_context():
+        moved = archive.archive_course(course_id, '2024-autumn', batch_size=1)
+        assert moved == {'grade': 0, 'submission': 2, 'enrollment': 1,
+                         'assignment': 0, 'course': 1}
+        assert db.session.get(archive.ArchivedCourse, course_id).status == 'archived'
+
+    response = client.get(
+        f'/api/courses/{course_id}/student-grades/{student_id}', headers=headers)
+    assert response.status_code == 200
+    assert sorted(g['value'] for g in response.get_json()) == [50, 70]
+
+
+def test_request_profiling_cleans_up_when_view_raises(client, tmp_path,
+                                                      monkeypatch):
+    from app import _profile_lock
+
+    monkeypatch.setitem(app.config, 'PROFILE_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'PROFILE_TOKEN', 'profile-secret')
+    profile_headers = {'X-Profile-Token': 'profile-secret'}
+
+    # A token for a user that does not exist makes the view hit None.role
+    token = jwt.encode({'user_id': 999999}, app.config['SECRET_KEY'])
+    threads_before = threading.active_count()
+    with pytest.raises(AttributeError):
+        client.get('/api/courses/1/student-grades/1', headers={
+            'Authorization': f'Bearer {token}', **profile_headers})
+
+    assert not _profile_lock.locked()
+    assert threading.active_count() == threads_before
+
+    response = client.get('/api/', headers=profile_headers)
+    assert 'X-Profile-Id' in response.headers
+
+
+def test_request_profiling_prunes_old_profiles_and_skips_bad_files(
+        client, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILE_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'PROFILE_TOKEN', 'profile-secret')
+    monkeypatch.setitem(app.config, 'PROFILE_MAX_COUNT', 2)
+    profile_headers = {'X-Profile-Token': 'profile-secret'}
+
+    profile_ids = []
+    for _ in range(3):
+        response = client.get('/api/', headers=profile_headers)
+        profile_ids.append(response.headers['X-Profile-Id'])
+        time.sleep(0.002)
+
+    assert not any(path.name.startswith(profile_ids[0])
+                   for path in tmp_path.iterdir())
+    assert len(list(tmp_path.glob('*.pstats'))) == 2
+
+    (tmp_path / '1-truncated.json').write_text('{"id": ')
+    (tmp_path / '2-list.json').write_text('[]')
+    (tmp_path / '0-legacy.json').write_text('{"id": "0-legacy"}')
+    profiles = client.get('/api/admin/profiles',
+                          headers=profile_headers).get_json()
+    assert [p['id'] for p in profiles] == profile_ids[:0:-1] + ['0-legacy']
+
+
+def test_grade_analytics_cache_evicts_least_recently_used(monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, 'GRADE_ANALYTICS_CACHE_SIZE', 2)
+    monkeypatch.setattr(app_module, '_grade_analytics_cache',
+                        app_module.OrderedDict())
+
+    app_module.store_cached_analytics(1, {'latest': 1})
+    app_module.store_cached_analytics(2, {'latest': 2})
+    assert app_module.get_cached_analytics(1) == {'latest': 1}
+    app_module.store_cached_analytics(3, {'latest': 3})
+
+    assert app_module.get_cached_analytics(2) is None
+    assert list(app_module._grade_analytics_cache) == [1, 3]
+
+
+def _add_graded_course(title, teacher_id, student_id, values):
+    course = Course(title=title, teacher_id=teacher_id)
+    db.session.add(course)
+    db.session.commit()
+    for value in values:
+        submission = Submission(student_id=student_id, course_id=course.id)
+        db.session.add(submission)
+        db.session.flush()
+        db.session.add(Grade(submission_id=submission.id,
+                             course_id=course.id, value=value))
+    db.session.commit()
+    return course.id
+
+
+def _archived_grades(path):
+    import sqlite3
+
+    archive = sqlite3.connect(path)
+    try:
+        return archive.execute(
+            'SELECT id, course_id, value FROM grade ORDER BY id').fetchall()
+    finally:
+        archive.close()
+
+
+def test_archive_two_courses_into_one_term_never_reuses_ids(client, auth_token,
+                                                            tmp_path, monkeypatch):
+    from archive import archive_course
+
+    monkeypatch.setitem(app.config, 'ARCHIVE_FOLDER', str(tmp_path))
+    with app.app_context():
+        teacher = User.query.filter_by(username='testuser').first()
+        student = User(username='twoterms', password='pass123', role='student')
+        db.session.add(student)
+        db.session.commit()
+
+        first_id = _add_graded_course('First', teacher.id, student.id, [10, 20])
+        first_grade_ids = [g.id for g in Grade.query.filter_by(course_id=first_id)]
+        archive_course(first_id, '2024-spring')
+
+        # The archived course held the highest IDs; new rows must not reuse them
+        second_id = _add_graded_course('Second', teacher.id, student.id, [30, 40])
+        assert second_id > first_id
+        second_grade_ids = [g.id for g in Grade.query.filter_by(course_id=second_id)]
+        assert min(second_grade_ids) > max(first_grade_ids)
+
+        archive_course(second_id, '2024-spring')
+
+    grades = _archived_grades(tmp_path / '2024-spring.db')
+    assert [(course_id, value) for _, course_id, value in grades] == [
+        (first_id, 10), (first_id, 20), (second_id, 30), (second_id, 40)]
+
+    response = client.post('/api/courses',
+                           headers={'Authorization': f'Bearer {auth_token}'},
+                           json={'title': 'Fresh', 'description': 'New'})
+    assert response.get_json()['course']['id'] > second_id
+
+
+def test_archive_conflicting_id_fails_loudly_and_keeps_rows(client, auth_token,
+                                                            tmp_path, monkeypatch):
+    import sqlite3
+    import archive
+
+    monkeypatch.setitem(app.config, 'ARCHIVE_FOLDER', str(tmp_path))
+    with app.app_context():
+        teacher = User.query.filter_by(username='testuser').first()
+        student = User(username='clash', password='pass123', role='student')
+        db.session.add(student)
+        db.session.commit()
+        course_id = _add_graded_course('Clash', teacher.id, student.id, [55])
+        grade_id = Grade.query.filter_by(course_id=course_id).one().id
+
+        # Another course's grade already occupies this ID in the archive
+        path = archive.create_archive('2024-spring')
+        other = sqlite3.connect(path)
+        other.execute('INSERT INTO grade (id, submission_id, course_id, value) '
+                      'VALUES (?, 1, ?, 99)', (grade_id, course_id + 1000))
+        other.commit()
+        other.close()
+
+        with pytest.raises(archive.ArchiveConflictError):
+            archive.archive_course(course_id, '2024-spring')
+        assert db.session.get(Grade, grade_id).value == 55
+
+
+def test_archive_batch_failure_rolls_back_and_keeps_error(client, auth_token,
+                                                          tmp_path, monkeypatch):
+    import archive
+
+    monkeypatch.setitem(app.config, 'ARCHIVE_FOLDER', str(tmp_path))
+    with app.app_context():
+        teacher = User.query.filter_by(username='testuser').first()
+        student = User(username='midbatch', password='pass123', role='student')
+        db.session.add(student)
+        db.session.commit()
+        course_id = _add_graded_course('Mid Batch', teacher.id, student.id, [60])
+
+        copy_and_delete = archive._copy_and_delete
+
+        def failing_copy_and_delete(connection, table, *args, **kwargs):
+            copy_and_delete(connection, table, *args, **kwargs)
+            raise RuntimeError('failed before commit')
+
+        monkeypatch.setattr(archive, '_copy_and_delete', failing_copy_and_delete)
+        with pytest.raises(RuntimeError, match='failed before commit'):
+            archive.archive_course(course_id, '2024-spring')
+
+        db.session.expire_all()
+        assert Grade.query.filter_by(course_id=course_id).count() == 1
+    assert _archived_grades(tmp_path / '2024-spring.db') == []
+
+
+def test_migrate_autoincrement_rebuilds_old_tables(client):
+    from app import ArchivedCourse, migrate_autoincrement
+
+    with app.app_context():
+        teacher = User(username='legacy', password='pass123', role='teacher')
+        db.session.add(teacher)
+        db.session.commit()
+        # A course table as created before archiving existed
+        db.session.execute(db.text('DROP TABLE course'))
+        db.session.execute(db.text(
+            'CREATE TABLE course (id INTEGER NOT NULL, title VARCHAR(100) NOT NULL, '
+            'description TEXT, teacher_id INTEGER NOT NULL, PRIMARY KEY (id))'))
+        db.session.execute(db.text(
+            "INSERT INTO course (id, title, teacher_id) VALUES (1, 'Kept', :t)"),
+            {'t': teacher.id})
+        db.session.add(ArchivedCourse(course_id=5, term='2024-spring',
+                                      title='Archived', teacher_id=teacher.id,
+                                      status='archived'))
+        db.session.commit()
+
+        migrate_autoincrement()
+
+        sql = db.session.execute(db.text(
+            "SELECT sql FROM sqlite_master WHERE name = 'course'")).scalar()
+        assert 'AUTOINCREMENT' in sql
+        assert db.session.get(Course, 1).title == 'Kept'
+
+        course = Course(title='After migration', teacher_id=teacher.id)
+        db.session.add(course)
+        db.session.commit()
+        assert course.id == 6